@@ -3,78 +3,159 @@ Dot File - Airtable Operations
 Lookup client SharePoint URLs, project folders, update records
 """
 
-import requests
+import logging
 import os
-from datetime import datetime
+import time
+from datetime import datetime, timezone
+
+import orjson
+
+from http_client import SESSION, DEFAULT_TIMEOUT
+
+log = logging.getLogger(__name__)
 
 AIRTABLE_API_KEY = os.environ.get('AIRTABLE_API_KEY')
 AIRTABLE_BASE_ID = os.environ.get('AIRTABLE_BASE_ID', 'app8CI7NAZqhQ4G1Y')
 
+# Sent per call rather than set on the shared session, so the Airtable
+# token never goes to other hosts
 HEADERS = {
     'Authorization': f'Bearer {AIRTABLE_API_KEY}',
     'Content-Type': 'application/json'
 }
 
 
+# Clients rarely change - remember lookups for a few minutes
+CLIENT_CACHE_TTL = 300
+# Projects change more often (Round) - only absorb bursts on the same job
+PROJECT_CACHE_TTL = 60
+CACHE_MAX_ENTRIES = 512
+_client_cache = {}
+_project_cache = {}
+
+
+def _cache_get(cache, key):
+    entry = cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+
+def _cache_set(cache, key, value, ttl):
+    now = time.monotonic()
+    if len(cache) >= CACHE_MAX_ENTRIES:
+        # Drop expired entries first, then the oldest if still full
+        entries = list(cache.items())
+        for k, (expires_at, _) in entries:
+            if expires_at <= now:
+                cache.pop(k, None)
+        if len(cache) >= CACHE_MAX_ENTRIES:
+            cache.pop(entries[0][0], None)
+    # Re-insert so dict order stays oldest-first
+    cache.pop(key, None)
+    cache[key] = (now + ttl, value)
+
+
+def invalidate_client_cache():
+    """Forget cached client lookups (e.g. after changing a SharePoint URL)"""
+    _client_cache.clear()
+
+
+def invalidate_project_cache(record_id):
+    """Forget any cached lookup for this project record"""
+    for job_number, (_, project) in list(_project_cache.items()):
+        if project['record_id'] == record_id:
+            _project_cache.pop(job_number, None)
+
+
+def formula_equals(field, value):
+    """Build a filterByFormula equality test with the value safely quoted"""
+    escaped = str(value).replace('\\', '\\\\').replace("'", "\\'")
+    return f"{{{field}}} = '{escaped}'"
+
+
+_table_urls = {}
+
+
 def get_airtable_url(table):
-    return f'https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{table}'
+    url = _table_urls.get(table)
+    if url is None:
+        url = _table_urls[table] = f'https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{table}'
+    return url
 
 
 def get_client_sharepoint(client_code):
     """
     Look up SharePoint URL for a client code
     Returns: { sharepoint_url: str, client_name: str } or None
+    Successful lookups are cached for CLIENT_CACHE_TTL seconds
     """
+    cached = _cache_get(_client_cache, client_code)
+    if cached:
+        return cached
+    
     try:
         url = get_airtable_url('Clients')
         params = {
-            'filterByFormula': f"{{Client code}} = '{client_code}'",
-            'maxRecords': 1
+            'filterByFormula': formula_equals('Client code', client_code),
+            'maxRecords': 1,
+            'fields[]': ['Clients', 'Sharepoint ID']  # Only what we read back
         }
         
-        response = requests.get(url, headers=HEADERS, params=params)
+        response = SESSION.get(url, headers=HEADERS, params=params, timeout=DEFAULT_TIMEOUT)
         response.raise_for_status()
         
-        records = response.json().get('records', [])
+        records = orjson.loads(response.content).get('records', [])
         if not records:
-            print(f'No client found for code: {client_code}')
+            log.info('No client found for code: %s', client_code)
             return None
         
         fields = records[0].get('fields', {})
         sharepoint_url = fields.get('Sharepoint ID')  # Field is called 'Sharepoint ID' in Airtable
         
         if not sharepoint_url:
-            print(f'No SharePoint URL configured for: {client_code}')
+            log.warning('No SharePoint URL configured for: %s', client_code)
             return None
         
-        return {
+        result = {
             'sharepoint_url': sharepoint_url,
             'client_name': fields.get('Clients', client_code)
         }
+        _cache_set(_client_cache, client_code, result, CLIENT_CACHE_TTL)
+        return result
         
     except Exception as e:
-        print(f'Error looking up client SharePoint: {e}')
+        log.error('Error looking up client SharePoint: %s', e)
         return None
 
 
-def get_project_folder(job_number):
+def get_project_folder(job_number, fresh=False):
     """
     Look up project folder name, current round, and existing Files URL
     Returns: { folder_name: str, round: int, record_id: str, files_url: str } or None
+    Projects with a Files Url are cached for PROJECT_CACHE_TTL seconds.
+    fresh=True skips the cache - use it whenever Round is about to be incremented,
+    as the cache is per-process and another worker may have updated it.
     """
+    if not fresh:
+        cached = _cache_get(_project_cache, job_number)
+        if cached:
+            return cached
+    
     try:
         url = get_airtable_url('Projects')
         params = {
-            'filterByFormula': f"{{Job Number}} = '{job_number}'",
-            'maxRecords': 1
+            'filterByFormula': formula_equals('Job Number', job_number),
+            'maxRecords': 1,
+            'fields[]': ['Project Name', 'Round', 'Files Url']  # Only what we read back
         }
         
-        response = requests.get(url, headers=HEADERS, params=params)
+        response = SESSION.get(url, headers=HEADERS, params=params, timeout=DEFAULT_TIMEOUT)
         response.raise_for_status()
         
-        records = response.json().get('records', [])
+        records = orjson.loads(response.content).get('records', [])
         if not records:
-            print(f'No project found for: {job_number}')
+            log.info('No project found for: %s', job_number)
             return None
         
         record = records[0]
@@ -87,31 +168,38 @@ def get_project_folder(job_number):
         else:
             folder_name = job_number
         
-        return {
+        result = {
             'folder_name': folder_name,
             'round': fields.get('Round', 0) or 0,
             'record_id': record['id'],
             'files_url': fields.get('Files Url', '')  # Return existing Files URL if set
         }
         
+        # Don't cache a missing job bag - it's about to be set up via TRIAGE
+        if result['files_url']:
+            _cache_set(_project_cache, job_number, result, PROJECT_CACHE_TTL)
+        return result
+        
     except Exception as e:
-        print(f'Error looking up project: {e}')
+        log.error('Error looking up project: %s', e)
         return None
 
 
-def update_project_filing(record_id, round_number=None, files_url=None, destination=None):
+def update_project_filing(record_id, round_number=None, files_url=None, destination=None,
+                          files_updated=None):
     """
     Update project record with filing info
+    files_updated: ISO timestamp for 'Files Updated' (defaults to now)
     """
     if not record_id:
-        print('No record ID provided for update')
+        log.warning('No record ID provided for update')
         return False
     
     try:
         url = get_airtable_url('Projects')
         
         fields = {
-            'Files Updated': datetime.now().isoformat()
+            'Files Updated': files_updated or datetime.now(timezone.utc).isoformat()
         }
         
         if round_number is not None:
@@ -123,16 +211,18 @@ def update_project_filing(record_id, round_number=None, files_url=None, destinat
         if destination:
             fields['Last Filed To'] = destination
         
-        response = requests.patch(
+        response = SESSION.patch(
             f'{url}/{record_id}',
             headers=HEADERS,
-            json={'fields': fields}
+            json={'fields': fields},
+            timeout=DEFAULT_TIMEOUT
         )
         
         response.raise_for_status()
-        print(f'Updated Airtable record {record_id}')
+        invalidate_project_cache(record_id)
+        log.info('Updated Airtable record %s', record_id)
         return True
         
     except Exception as e:
-        print(f'Error updating project: {e}')
+        log.error('Error updating project: %s', e)
         return False
@@ -9,21 +9,89 @@ UPDATED: Files Url approach
 """
 
 from flask import Flask, jsonify, request
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
+import orjson
+import logging
 import os
+import re
 import json
-from datetime import datetime
+import time
+from datetime import date, datetime, timezone
+from functools import lru_cache
 
 import airtable
 import power_automate
 
+# LOG_LEVEL=WARNING in production skips formatting the per-request INFO lines
+logging.basicConfig(
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+log = logging.getLogger(__name__)
+
+
+class OrjsonProvider(JSONProvider):
+    """Route request.get_json() and jsonify() through orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response - no str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype='application/json')
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+# Reject oversize payloads before they're read or parsed
+app.config['MAX_CONTENT_LENGTH'] = 2_000_000
 CORS(app)
 
 # Hunch SharePoint (where Incoming folder lives)
 HUNCH_SITE_URL = os.environ.get('HUNCH_SITE_URL', 'https://hunch.sharepoint.com/sites/Hunch614')
 INCOMING_PATH = '/Shared Documents/-- Incoming'
 
+# Email HTML beyond this is clipped before it goes into the .eml
+MAX_EMAIL_CHARS = 256_000
+EMAIL_TRUNCATED_MARKER = f'\n<!-- Dot File: email truncated at {MAX_EMAIL_CHARS} characters -->'
+
+# Route to folder mapping
+ROUTE_TO_FOLDER = {
+    'triage': 'briefs',
+    'new-job': 'briefs',
+    'work-to-client': 'round',
+    'feedback': 'feedback',
+    'file': 'other',
+    'update': 'other',
+}
+
+# Folder type to actual folder name (Round folders are numbered per job)
+FOLDER_NAMES = {
+    'briefs': '-- Briefs',
+    'feedback': '-- Feedback',
+    'other': '-- Other',
+}
+
+# Anything other than letters, digits, space, '-' or '_' is dropped from filenames
+NAME_STRIP_RE = re.compile(r'[^\w \-]')
+
+# .eml body, rendered with a single str.format call per email
+EML_TEMPLATE = """MIME-Version: 1.0
+Date: {email_date}
+From: {sender_name} <{sender_email}>
+To: {recipient_str}
+Subject: {subject}
+Content-Type: text/html; charset="utf-8"
+
+{html_content}
+"""
+
 
 @app.route('/')
 def health():
@@ -50,13 +118,16 @@ def file_attachments():
         sender_name = data.get('senderName', 'Unknown')
         sender_email = data.get('senderEmail', '')
         subject_line = data.get('subjectLine', '')
-        email_content = data.get('emailContent', '')
+        email_content = data.get('emailContent') or ''
         attachment_names = data.get('attachmentNames', [])
         has_attachments = data.get('hasAttachments', False)
         received_datetime = data.get('receivedDateTime', '')
         project_record_id = data.get('projectRecordId')
         all_recipients = data.get('allRecipients', [])
         
+        if len(email_content) > MAX_EMAIL_CHARS:
+            email_content = email_content[:MAX_EMAIL_CHARS] + EMAIL_TRUNCATED_MARKER
+        
         # Fix: attachmentNames might arrive as a JSON string instead of a list
         if isinstance(attachment_names, str):
             try:
@@ -65,10 +136,10 @@ def file_attachments():
                 # If it's a single filename string, wrap it in a list
                 attachment_names = [attachment_names] if attachment_names else []
         
-        print(f'=== DOT FILE v2.0 ===')
-        print(f'Job: {job_number} | Client: {client_code}')
-        print(f'From: {sender_email}')
-        print(f'Attachments: {attachment_names}')
+        log.info('=== DOT FILE v2.0 ===')
+        log.info('Job: %s | Client: %s', job_number, client_code)
+        log.info('From: %s', sender_email)
+        log.info('Attachments: %s', attachment_names)
         
         if not job_number:
             return jsonify({
@@ -77,8 +148,22 @@ def file_attachments():
                 'filed': False
             }), 400
         
-        # 1. Get project info from Airtable (including Files Url)
-        project_info = airtable.get_project_folder(job_number)
+        # 1. Determine destination folder from route or folderType
+        route = data.get('route', '')
+        folder_type = data.get('folderType', '')  # Direct override from Ask Dot
+        
+        # folderType override takes priority, then route mapping, then default
+        if folder_type:
+            resolved_folder = folder_type
+        else:
+            resolved_folder = ROUTE_TO_FOLDER.get(route, 'other')
+        
+        log.info('Route: %s | FolderType: %s | Resolved: %s', route, folder_type, resolved_folder)
+        
+        # 2. Get project info from Airtable (including Files Url)
+        # Round filings increment the current Round, so read it live - a cached
+        # copy may predate another worker's update
+        project_info = airtable.get_project_folder(job_number, fresh=(resolved_folder == 'round'))
         
         if not project_info:
             return jsonify({
@@ -87,7 +172,7 @@ def file_attachments():
                 'filed': False
             }), 404
         
-        # 2. Get Files Url - this is REQUIRED
+        # 3. Get Files Url - this is REQUIRED
         files_url = project_info.get('files_url')
         
         if not files_url:
@@ -102,50 +187,23 @@ def file_attachments():
         if not project_record_id:
             project_record_id = project_info.get('record_id')
         
-        print(f'Files Url: {files_url}')
+        log.info('Files Url: %s', files_url)
         
-        # 3. Parse Files Url to get site and path
+        # 4. Parse Files Url to get site and path
         # Format: https://hunch.sharepoint.com/sites/Labour/Shared Documents/LAB 055 - Election 26
-        try:
-            # Split into site URL and path
-            if '/Shared Documents/' in files_url:
-                parts = files_url.split('/Shared Documents/')
-                dest_site_url = parts[0]  # https://hunch.sharepoint.com/sites/Labour
-                job_folder_path = parts[1]  # LAB 055 - Election 26
-            else:
-                raise ValueError(f'Invalid Files Url format: {files_url}')
-        except Exception as e:
-            print(f'Error parsing Files Url: {e}')
+        # Site URL: https://hunch.sharepoint.com/sites/Labour | Job folder: LAB 055 - Election 26
+        dest_site_url, sep, job_folder_path = files_url.partition('/Shared Documents/')
+        
+        if not sep:
+            log.warning('Invalid Files Url format: %s', files_url)
             return jsonify({
                 'success': False,
                 'error': f'Invalid Files Url format for {job_number}',
                 'filed': False
             }), 400
         
-        print(f'Dest site: {dest_site_url}')
-        print(f'Job folder: {job_folder_path}')
-        
-        # 4. Determine destination folder from route or folderType
-        route = data.get('route', '')
-        folder_type = data.get('folderType', '')  # Direct override from Ask Dot
-        
-        # Route to folder mapping
-        ROUTE_TO_FOLDER = {
-            'triage': 'briefs',
-            'new-job': 'briefs',
-            'work-to-client': 'round',
-            'feedback': 'feedback',
-            'file': 'other',
-            'update': 'other',
-        }
-        
-        # folderType override takes priority, then route mapping, then default
-        if folder_type:
-            resolved_folder = folder_type
-        else:
-            resolved_folder = ROUTE_TO_FOLDER.get(route, 'other')
-        
-        print(f'Route: {route} | FolderType: {folder_type} | Resolved: {resolved_folder}')
+        log.info('Dest site: %s', dest_site_url)
+        log.info('Job folder: %s', job_folder_path)
         
         # 5. Handle Round logic if work-to-client
         round_number = None
@@ -154,35 +212,32 @@ def file_attachments():
             current_round = project_info.get('round', 0) or 0
             round_number = current_round + 1
             destination_folder = f"-- Round {round_number}"
-            print(f'Outgoing work - Round {round_number}')
+            log.info('Outgoing work - Round %s', round_number)
         else:
             # Map folder type to actual folder name
-            FOLDER_NAMES = {
-                'briefs': '-- Briefs',
-                'feedback': '-- Feedback',
-                'other': '-- Other',
-            }
             destination_folder = FOLDER_NAMES.get(resolved_folder, '-- Other')
         
         # 6. Build full destination path (include /Shared Documents/ for SharePoint API)
         dest_path = f"/Shared Documents/{job_folder_path}/{destination_folder}"
         folder_url = f"{files_url}/{destination_folder}"
         
-        print(f'Destination path: {dest_path}')
-        print(f'Folder URL: {folder_url}')
+        log.info('Destination path: %s', dest_path)
+        log.info('Folder URL: %s', folder_url)
         
         # 7. Build .eml filename if we have email content
         eml_filename = ''
         eml_content = ''
         if email_content:
-            eml_filename = create_eml_filename(sender_name, received_datetime)
+            received_dt = parse_received_datetime(received_datetime)
+            eml_filename = create_eml_filename(sender_name, received_dt)
             eml_content = create_eml_content(
                 sender_name=sender_name,
                 sender_email=sender_email,
                 recipients=all_recipients,
                 subject=subject_line,
                 html_content=email_content,
-                received_datetime=received_datetime
+                received_datetime=received_datetime,
+                received_dt=received_dt
             )
         
         # 8. Call PA Filing
@@ -198,7 +253,7 @@ def file_attachments():
             email_content=eml_content
         )
         
-        print(f'PA result: {pa_result}')
+        log.info('PA result: %s', pa_result)
         
         if not pa_result.get('success'):
             return jsonify({
@@ -209,10 +264,12 @@ def file_attachments():
         
         # 9. Update Airtable with round number if applicable
         if project_record_id and round_number:
+            filed_at = datetime.now(timezone.utc).isoformat()
             airtable.update_project_filing(
                 record_id=project_record_id,
                 round_number=round_number,
-                destination=destination_folder
+                destination=destination_folder,
+                files_updated=filed_at
             )
         
         # 10. Build response
@@ -234,48 +291,68 @@ def file_attachments():
             'folderType': resolved_folder
         })
         
+    except RequestEntityTooLarge:
+        return jsonify({
+            'success': False,
+            'error': f'Request larger than {app.config["MAX_CONTENT_LENGTH"]} bytes',
+            'filed': False
+        }), 413
     except Exception as e:
-        print(f'Error in /file: {e}')
-        import traceback
-        traceback.print_exc()
+        log.exception('Error in /file')
         return jsonify({'success': False, 'error': str(e), 'filed': False}), 500
 
 
-def create_eml_filename(sender_name, received_datetime):
-    """Create filename like 'Email from Sarah - 18 Jan 2026.eml'"""
+def parse_received_datetime(received_datetime):
+    """Parse Traffic's ISO timestamp once - returns a datetime, or None if missing/malformed"""
+    if not received_datetime:
+        return None
     try:
-        dt = datetime.fromisoformat(received_datetime.replace('Z', '+00:00'))
-        date_str = dt.strftime('%d %b %Y')
-    except:
-        date_str = datetime.now().strftime('%d %b %Y')
+        return datetime.fromisoformat(received_datetime.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):  # Not a string / not ISO 8601
+        return None
+
+
+@lru_cache(maxsize=1)
+def format_day(year, month, day):
+    """'18 Jan 2026' - cached, as the fallback date only changes once a day"""
+    return date(year, month, day).strftime('%d %b %Y')
+
+
+def create_eml_filename(sender_name, received_dt):
+    """Create filename like 'Email from Sarah - 18 Jan 2026.eml'"""
+    if received_dt:
+        date_str = received_dt.strftime('%d %b %Y')
+    else:
+        date_str = format_day(*time.localtime()[:3])
     
     # Get first name, clean up
     clean_name = sender_name.split()[0] if sender_name else 'Unknown'
-    clean_name = ''.join(c for c in clean_name if c.isalnum() or c in ' -_')
+    clean_name = NAME_STRIP_RE.sub('', clean_name)
     
     return f"Email from {clean_name} - {date_str}.eml"
 
 
-def create_eml_content(sender_name, sender_email, recipients, subject, html_content, received_datetime):
-    """Create .eml file content"""
+def create_eml_content(sender_name, sender_email, recipients, subject, html_content,
+                       received_datetime, received_dt=None):
+    """Create .eml file content (falls back to the raw timestamp if it didn't parse)"""
     recipient_str = ', '.join(recipients) if recipients else ''
     
-    try:
-        dt = datetime.fromisoformat(received_datetime.replace('Z', '+00:00'))
-        email_date = dt.strftime('%a, %d %b %Y %H:%M:%S %z')
-    except:
+    if received_dt:
+        email_date = received_dt.strftime('%a, %d %b %Y %H:%M:%S %z')
+    else:
         email_date = received_datetime
     
-    return f"""MIME-Version: 1.0
-Date: {email_date}
-From: {sender_name} <{sender_email}>
-To: {recipient_str}
-Subject: {subject}
-Content-Type: text/html; charset="utf-8"
-
-{html_content}
-"""
+    return EML_TEMPLATE.format(
+        email_date=email_date,
+        sender_name=sender_name,
+        sender_email=sender_email,
+        recipient_str=recipient_str,
+        subject=subject,
+        html_content=html_content
+    )
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
+    # Local dev only - production runs under gunicorn (see gunicorn_conf.py).
+    # Debugger/reloader stay off unless FLASK_DEBUG=1.
+    app.run(port=5001)
@@ -3,12 +3,51 @@ Dot File - Classification Logic
 Uses Claude to determine where attachments should be filed
 """
 
-import requests
+import hashlib
+import logging
 import os
-import json
+import re
+import threading
+from collections import OrderedDict
+
+import orjson
+
+from http_client import SESSION, DEFAULT_TIMEOUT
+
+log = logging.getLogger(__name__)
 
 ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
 
+# Claude results keyed on a fingerprint of the prompt, so replayed requests skip the API
+CLASSIFICATION_CACHE_SIZE = 2048
+_classification_cache = OrderedDict()
+_classification_lock = threading.Lock()
+
+# Recipients listed in the prompt beyond this are summarised as '(+N more)'
+PROMPT_MAX_RECIPIENTS = 15
+
+# Claude's reply: a fenced ```json block wins; only without one do we fall back
+# to the span from the first '{' to the last '}'
+JSON_FENCE_RE = re.compile(r'```json\s*(\{.*?\})\s*```', re.S)
+
+# Fallback rule signals - substring matches, so 'amend' also hits 'amends'
+JOB_CODE_RE = re.compile(r'[A-Z]{3}\s?\d{3}')
+DELIVERABLE_EXTS = ('.pdf', '.docx', '.pptx')
+DELIVERY_PHRASES = ('for your review', 'for review', 'attached', 'latest')
+BRIEF_WORDS = ('brief', 'scope', 'requirement', 'kickoff')
+FEEDBACK_WORDS = ('feedback', 'amend', 'comment', 'change', 'revision')
+
+
+def _any_substring_re(words):
+    """One compiled alternation - a single scan instead of one 'in' per word"""
+    return re.compile('|'.join(re.escape(word) for word in words))
+
+
+DELIVERABLE_EXT_RE = _any_substring_re(DELIVERABLE_EXTS)
+DELIVERY_PHRASE_RE = _any_substring_re(DELIVERY_PHRASES)
+BRIEF_WORD_RE = _any_substring_re(BRIEF_WORDS)
+FEEDBACK_WORD_RE = _any_substring_re(FEEDBACK_WORDS)
+
 SYSTEM_PROMPT = """You're a filing assistant for Hunch creative agency. Classify where email attachments should be filed.
 
 ## Folder Options
@@ -51,32 +90,80 @@ If is_outgoing is true, folder will be ignored (system creates Round X).
 """
 
 
+def _unique_recipients(recipients):
+    """Drop repeat addresses (case-insensitive), keeping first-seen order"""
+    seen = set()
+    unique = []
+    for recipient in recipients:
+        key = recipient.lower()
+        if key not in seen:
+            seen.add(key)
+            unique.append(recipient)
+    return unique
+
+
+def _recipient_summary(recipients):
+    """'a, b, c (+N more)' - long CC lists just cost prompt tokens"""
+    shown = ', '.join(recipients[:PROMPT_MAX_RECIPIENTS])
+    extra = len(recipients) - PROMPT_MAX_RECIPIENTS
+    return f'{shown} (+{extra} more)' if extra > 0 else shown
+
+
+def _cached_classification(key):
+    with _classification_lock:
+        result = _classification_cache.get(key)
+        if result is None:
+            return None
+        _classification_cache.move_to_end(key)
+        return dict(result)
+
+
+def _remember_classification(key, result):
+    with _classification_lock:
+        _classification_cache[key] = dict(result)
+        _classification_cache.move_to_end(key)
+        if len(_classification_cache) > CLASSIFICATION_CACHE_SIZE:
+            _classification_cache.popitem(last=False)
+
+
 def classify_filing(sender_email, all_recipients, subject_line, email_content, attachment_names):
     """
     Use Claude to classify where files should be filed
     """
     
+    # Cheap rules first - clear-cut deliveries don't need a Claude round trip
+    rule_result = fallback_classification(sender_email, subject_line, attachment_names)
+    if rule_result['confidence'] == 'high':
+        return rule_result
+    
     if not ANTHROPIC_API_KEY:
-        print('No Anthropic API key - using fallback')
-        return fallback_classification(sender_email, subject_line, attachment_names)
+        log.warning('No Anthropic API key - using fallback')
+        return rule_result
     
     is_from_hunch = '@hunch.co.nz' in sender_email.lower()
-    external_recipients = [r for r in all_recipients if '@hunch.co.nz' not in r.lower()]
+    recipients = _unique_recipients(all_recipients)
+    external_recipients = [r for r in recipients if '@hunch.co.nz' not in r.lower()]
     
     user_message = f"""Classify where these attachments should be filed:
 
 **Sender**: {sender_email} {"(Hunch)" if is_from_hunch else "(Client)"}
-**Recipients**: {', '.join(all_recipients)}
-**External recipients**: {', '.join(external_recipients) if external_recipients else "None"}
+**Recipients**: {_recipient_summary(recipients)}
+**External recipients**: {_recipient_summary(external_recipients) if external_recipients else "None"}
 **Subject**: {subject_line}
 **Attachments**: {', '.join(attachment_names) if attachment_names else "None"}
 
 **Email content**:
 {email_content[:2000] if email_content else "No content"}
 """
+    
+    # The prompt is everything Claude sees, so it's the natural cache key
+    cache_key = hashlib.blake2b(user_message.encode(), digest_size=16).digest()
+    cached = _cached_classification(cache_key)
+    if cached:
+        return cached
 
     try:
-        response = requests.post(
+        response = SESSION.post(
             'https://api.anthropic.com/v1/messages',
             headers={
                 'x-api-key': ANTHROPIC_API_KEY,
@@ -89,11 +176,11 @@ def classify_filing(sender_email, all_recipients, subject_line, email_content, a
                 'system': SYSTEM_PROMPT,
                 'messages': [{'role': 'user', 'content': user_message}]
             },
-            timeout=30
+            timeout=(DEFAULT_TIMEOUT[0], 30)
         )
         
         response.raise_for_status()
-        result = response.json()
+        result = orjson.loads(response.content)
         
         assistant_message = ''
         for block in result.get('content', []):
@@ -104,69 +191,67 @@ def classify_filing(sender_email, all_recipients, subject_line, email_content, a
         parsed = parse_json_response(assistant_message)
         
         if parsed:
+            _remember_classification(cache_key, parsed)
             return parsed
         else:
-            print(f'Failed to parse: {assistant_message}')
-            return fallback_classification(sender_email, subject_line, attachment_names)
+            log.warning('Failed to parse: %s', assistant_message)
+            return rule_result
             
     except Exception as e:
-        print(f'Claude error: {e}')
-        return fallback_classification(sender_email, subject_line, attachment_names)
+        log.error('Claude error: %s', e)
+        return rule_result
 
 
 def parse_json_response(text):
-    """Extract JSON from Claude's response"""
+    """Extract JSON from Claude's response - a ```json fence if present, else the outermost {...}"""
     if not text:
         return None
     
-    text = text.strip()
-    
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        pass
-    
-    if '```json' in text:
-        try:
-            start = text.find('```json') + 7
-            end = text.find('```', start)
-            if end > start:
-                return json.loads(text[start:end].strip())
-        except:
-            pass
-    
-    try:
+    match = JSON_FENCE_RE.search(text)
+    if match:
+        candidate = match.group(1)
+    else:
         start = text.find('{')
         end = text.rfind('}')
-        if start != -1 and end > start:
-            return json.loads(text[start:end + 1])
-    except:
-        pass
+        if start == -1 or end < start:
+            return None
+        candidate = text[start:end + 1]
     
-    return None
+    try:
+        return orjson.loads(candidate)
+    except orjson.JSONDecodeError:
+        return None
 
 
 def fallback_classification(sender_email, subject_line, attachment_names):
-    """Rule-based fallback if Claude unavailable"""
+    """Rule-based classification - used as-is when confident, else as fallback if Claude unavailable"""
     subject_lower = subject_line.lower()
-    sender_lower = sender_email.lower()
-    attachments_str = ' '.join(attachment_names).lower()
+    attachments_joined = ' '.join(attachment_names)
+    attachments_str = attachments_joined.lower()
     
-    is_from_hunch = '@hunch.co.nz' in sender_lower
+    is_from_hunch = '@hunch.co.nz' in sender_email.lower()
     
     # Check for outgoing
     outgoing_signals = 0
     if is_from_hunch:
         outgoing_signals += 1
-    if any(ext in attachments_str for ext in ['.pdf', '.docx', '.pptx']):
+    if DELIVERABLE_EXT_RE.search(attachments_str):
         outgoing_signals += 1
-    if any(phrase in subject_lower for phrase in ['for your review', 'for review', 'attached', 'latest']):
+    if DELIVERY_PHRASE_RE.search(subject_lower):
         outgoing_signals += 1
     
-    import re
-    if re.search(r'[A-Z]{3}\s?\d{3}', ' '.join(attachment_names)):
+    if JOB_CODE_RE.search(attachments_joined):
         outgoing_signals += 1
     
+    # 3+ signals is the prompt's own threshold - confident enough to skip Claude
+    if outgoing_signals >= 3 and is_from_hunch:
+        return {
+            'folder': 'Other',
+            'is_outgoing': True,
+            'confidence': 'high',
+            'reasoning': 'Rules: From Hunch with 3+ delivery signals'
+        }
+    
     if outgoing_signals >= 2 and is_from_hunch:
         return {
             'folder': 'Other',
@@ -175,7 +260,7 @@ def fallback_classification(sender_email, subject_line, attachment_names):
             'reasoning': 'Fallback: From Hunch with delivery signals'
         }
     
-    if any(word in subject_lower for word in ['brief', 'scope', 'requirement', 'kickoff']):
+    if BRIEF_WORD_RE.search(subject_lower):
         return {
             'folder': 'Briefs',
             'is_outgoing': False,
@@ -183,7 +268,7 @@ def fallback_classification(sender_email, subject_line, attachment_names):
             'reasoning': 'Fallback: Brief keywords in subject'
         }
     
-    if any(word in subject_lower for word in ['feedback', 'amend', 'comment', 'change', 'revision']):
+    if FEEDBACK_WORD_RE.search(subject_lower):
         return {
             'folder': 'Feedback',
             'is_outgoing': False,
@@ -0,0 +1,22 @@
+"""
+Dot File - Gunicorn Config
+Threaded workers: /file spends nearly all its time waiting on Airtable and PA Filing
+"""
+
+import multiprocessing
+import os
+
+# cpu_count() reports the host's CPUs inside a container, not the container's
+# share, so the default is capped - set WEB_CONCURRENCY to size it properly
+MAX_DEFAULT_WORKERS = 4
+
+# Binds to $PORT automatically (gunicorn default when PORT is set)
+workers = int(os.environ.get('WEB_CONCURRENCY',
+                             min(multiprocessing.cpu_count() * 2 + 1, MAX_DEFAULT_WORKERS)))
+worker_class = 'gthread'
+# Request threads are the only callers of the shared session, so at most one
+# connection each - under pool_maxsize of 20 on both the Airtable/Claude and
+# PA Filing adapters (http_client.py, power_automate.py)
+threads = 16
+timeout = 150  # Longer than PA Filing's 120s read timeout
+keepalive = 5
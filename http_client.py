@@ -0,0 +1,29 @@
+"""
+Dot File - Shared HTTP Session
+One pooled, keep-alive session for every outbound call (Airtable, PA Filing, Claude)
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) seconds - applied to every call unless overridden
+DEFAULT_TIMEOUT = (3.05, 15)
+
+# Module-level singleton: lives for the whole worker process so connections
+# stay warm between requests. Never create one per request.
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=20,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True,
+        # Airtable PATCHes set absolute values so are safe to repeat;
+        # POSTs (PA Filing moves files) are never retried
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {'PATCH'},
+        raise_on_status=False  # Let callers see the final response
+    )
+))
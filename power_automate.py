@@ -3,12 +3,51 @@ Dot File - Power Automate Integration
 Calls PA Filing flow to move files in SharePoint
 """
 
+import logging
 import requests
 import os
+from urllib.parse import urlsplit
+
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from http_client import SESSION, DEFAULT_TIMEOUT
+
+log = logging.getLogger(__name__)
 
 PA_FILING_URL = os.environ.get('PA_FILING_URL')
 
 
+class _PaRetry(Retry):
+    """Retry-After only triggers a retry on 429 (urllib3 also does 413 and 503)"""
+    RETRY_AFTER_STATUS_CODES = frozenset({429})
+
+
+# PA throttles with 429 + Retry-After. A throttled call never ran the flow, so
+# it's the one failure that's safe to replay for a POST that moves files.
+# A 503 or 413 may come after the flow started, so those are never replayed.
+PA_RETRY = _PaRetry(
+    total=3,
+    connect=2,  # Nothing sent yet
+    read=False,  # The flow may have run - never replay; re-raise the ReadTimeout as-is
+    other=0,
+    status=3,
+    status_forcelist=[429],
+    allowed_methods=None,  # Include POST - only the cases above get retried
+    backoff_factor=0.5,
+    respect_retry_after_header=True,
+    raise_on_status=False  # Fall through to the normal 'PA returned 429' error
+)
+
+if PA_FILING_URL:
+    _pa_url = urlsplit(PA_FILING_URL)
+    SESSION.mount(
+        f'{_pa_url.scheme}://{_pa_url.netloc}/',
+        HTTPAdapter(pool_maxsize=20, max_retries=PA_RETRY)
+    )
+
+
 def call_filing(source_site_url, source_path, source_files, dest_site_url, dest_path,
                 create_folder=True, save_email=False, email_filename='', email_content=''):
     """
@@ -18,7 +57,7 @@ def call_filing(source_site_url, source_path, source_files, dest_site_url, dest_
     """
     
     if not PA_FILING_URL:
-        print('ERROR: PA_FILING_URL not configured')
+        log.error('PA_FILING_URL not configured')
         return {'success': False, 'error': 'PA_FILING_URL not configured'}
     
     payload = {
@@ -33,38 +72,39 @@ def call_filing(source_site_url, source_path, source_files, dest_site_url, dest_
         'emailContent': email_content
     }
     
-    print(f'Calling PA Filing:')
-    print(f'  Source: {source_site_url}{source_path}')
-    print(f'  Files: {source_files}')
-    print(f'  Dest: {dest_site_url}{dest_path}')  # dest_path now includes /Shared Documents/
-    print(f'  Create folder: {create_folder}')
-    print(f'  Save email: {save_email}')
+    log.info('Calling PA Filing:')
+    log.info('  Source: %s%s', source_site_url, source_path)
+    log.info('  Files: %s', source_files)
+    log.info('  Dest: %s%s', dest_site_url, dest_path)  # dest_path now includes /Shared Documents/
+    log.info('  Create folder: %s', create_folder)
+    log.info('  Save email: %s', save_email)
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             PA_FILING_URL,
-            json=payload,
+            data=orjson.dumps(payload),  # emailContent can be large - encode in C
             headers={'Content-Type': 'application/json'},
-            timeout=120  # 2 minute timeout for file operations
+            timeout=(DEFAULT_TIMEOUT[0], 120)  # 2 minute timeout for file operations
         )
         
-        print(f'PA response status: {response.status_code}')
+        log.info('PA response status: %s', response.status_code)
         
         if response.status_code == 200:
-            result = response.json()
-            print(f'PA response: {result}')
+            result = orjson.loads(response.content)
+            log.info('PA response: %s', result)
             return result
         else:
             error_text = response.text[:500]
-            print(f'PA error: {response.status_code} - {error_text}')
+            log.error('PA error: %s - %s', response.status_code, error_text)
             return {
                 'success': False,
                 'error': f'PA returned {response.status_code}: {error_text}'
             }
             
     except requests.exceptions.Timeout:
-        print('PA request timed out')
+        log.error('PA request timed out')
         return {'success': False, 'error': 'PA Filing request timed out'}
     except Exception as e:
-        print(f'PA request failed: {e}')
-        return {'success': False, 'error': str(e)}
+        # str(e) would carry the trigger URL and its signed query string
+        log.error('PA request failed: %s', type(e).__name__)
+        return {'success': False, 'error': 'PA Filing request failed'}